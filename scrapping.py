@@ -7,7 +7,7 @@ Cómo ejecutar localmente:
 1) Crea y activa un entorno (opcional):
    python -m venv .venv && source .venv/bin/activate  # Windows: .venv\Scripts\activate
 2) Instala dependencias:
-   pip install streamlit requests beautifulsoup4 lxml pandas openpyxl urllib3
+   pip install streamlit requests requests-cache httpx[http2] selectolax lxml pandas openpyxl xlsxwriter urllib3
 3) Ejecuta:
    streamlit run streamlit_scraper_comics_manga.py
 
@@ -17,68 +17,172 @@ Notas:
 """
 
 from __future__ import annotations
+import asyncio
+import codecs
+import functools
 import re
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import BytesIO
 from urllib.parse import urljoin
 
+import httpx
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+import requests_cache
+from lxml import etree
 from lxml import html as lxml_html
 from requests.adapters import HTTPAdapter
+from selectolax.lexbor import LexborHTMLParser
 from urllib3.util.retry import Retry
 import streamlit as st
+import xlsxwriter
 
 # =============== Utilidades HTTP ===============
 
+# Sockets keep-alive por host; debe ser >= MAX_WORKERS para que ningún hilo espere conexión
+POOL_SIZE = 32
+
+# Tope de descarga por página: un selector mal apuntado a un recurso enorme no bloquea el lote
+MAX_PAGE_BYTES = 8 * 1024 * 1024
+FETCH_CHUNK_BYTES = 8192
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+def within_page_cap(response: requests.Response) -> bool:
+    # requests-cache lee el cuerpo completo para guardarlo; sólo se cachean respuestas que
+    # declaran un tamaño dentro del tope. Las demás (incluidas las chunked, sin Content-Length)
+    # no pasan por la caché y se pueden cortar durante el streaming
+    length = response.headers.get("Content-Length", "")
+    return length.isdigit() and int(length) <= MAX_PAGE_BYTES
+
+
 def make_session() -> requests.Session:
-    session = requests.Session()
+    # Caché HTTP persistente en disco: las URLs repetidas entre ejecuciones no vuelven a la red
+    session = requests_cache.CachedSession(
+        "scraper_cache",
+        backend="sqlite",
+        expire_after=3600,
+        allowable_methods=("GET", "HEAD"),
+        filter_fn=within_page_cap,
+    )
     retries = Retry(
         total=3,
         backoff_factor=0.5,
         status_forcelist=(429, 500, 502, 503, 504),
         allowed_methods=("GET", "HEAD"),
     )
-    adapter = HTTPAdapter(max_retries=retries)
+    adapter = HTTPAdapter(
+        pool_connections=POOL_SIZE,
+        pool_maxsize=POOL_SIZE,
+        max_retries=retries,
+        pool_block=False,
+    )
     session.mount("http://", adapter)
     session.mount("https://", adapter)
-    session.headers.update({
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-            "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        )
-    })
+    session.headers.update({"User-Agent": USER_AGENT})
     return session
 
-SESSION = make_session()
+@st.cache_resource(show_spinner=False)
+def get_session() -> requests.Session:
+    """Sesión única por proceso: Streamlit la conserva entre reruns y usuarios (pool keep-alive compartido)."""
+    return make_session()
+
+# Descargas concurrentes por lote (el cuello de botella es la red, no la CPU)
+MAX_WORKERS = 8
+# Conexiones simultáneas del modo asíncrono (un solo event loop, sin hilos)
+ASYNC_MAX_CONNECTIONS = 64
 
 # =============== Heurísticas ===============
 
 PRICE_PATTERN = re.compile(r"([\$€£]|\bCLP\b|\bMXN\b|\bARS\b|\bPEN\b|\bCOP\b)?\s*([0-9]{1,3}(?:[.,\s][0-9]{3})*(?:[.,][0-9]{2})?|[0-9]+)")
-ISBN_PATTERN = re.compile(r"(?:ISBN(?:-1[03])?|SKU)\s*[:#]\s*([0-9Xx\- ]{8,20})")
+# ISBN-10 o ISBN-13 (prefijo 978/979) con guiones o espacios opcionales; el checksum se valida aparte.
+# Sin más dígitos a la derecha: una tira más larga no se recorta hasta un ISBN válido
+_ISBN_REGEX = r"(?:ISBN(?:-1[03])?|SKU)\s*[:#]?\s*((?:97[89][- ]?)?[0-9](?:[- ]?[0-9]){8}[- ]?[0-9Xx])(?![0-9Xx])"
+ISBN_PATTERN = re.compile(_ISBN_REGEX)
+# Variante en bytes para escanear el HTML crudo antes de extraer el texto de toda la página
+ISBN_BYTES = re.compile(_ISBN_REGEX.encode("ascii"))
+_STRIP_DASHSPACE = str.maketrans("", "", "- ")
+HEAD_SCAN_BYTES = 65536
+
+# Charset declarado: parámetro del Content-Type o <meta charset>/<meta http-equiv> en el inicio del HTML
+_CHARSET_HEADER = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.I)
+_CHARSET_META = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.I)
+
+# Tablas de traducción para normalize_price (una sola pasada en C en lugar de varios replace)
+_PRICE_TRANS = str.maketrans({"\xa0": "", " ": "", ".": "", ",": "."})
+_SWAP_SEPARATORS = str.maketrans({",": ".", ".": ","})
+
+
+def join_url(base_url: str, src: str) -> str:
+    # La mayoría de las imágenes ya vienen absolutas: evita el urlsplit de urljoin
+    if src.startswith(("http://", "https://")):
+        return src
+    if src.startswith("//"):
+        return base_url.partition(":")[0] + ":" + src
+    return urljoin(base_url, src)
+
+
+def header_charset(content_type: str) -> str | None:
+    # Sólo el charset explícito: sin él, requests supone ISO-8859-1 para text/* y eso rompe páginas UTF-8
+    m = _CHARSET_HEADER.search(content_type or "")
+    return m.group(1) if m else None
+
+
+def decode_html(content: bytes, charset: str | None = None) -> str:
+    """
+    Decodifica la página para selectolax (Lexbor asume UTF-8 con bytes y no lee <meta charset>):
+    charset de la cabecera, si no el de <meta> en el inicio del HTML, si no UTF-8.
+    """
+    if not charset:
+        m = _CHARSET_META.search(content, 0, HEAD_SCAN_BYTES)
+        charset = m.group(1).decode("ascii") if m else "utf-8"
+    if content.startswith(codecs.BOM_UTF8):
+        charset = "utf-8-sig"
+    try:
+        return content.decode(charset, errors="replace")
+    except LookupError:
+        return content.decode("utf-8", errors="replace")
+
+
+def isbn_checksum_ok(isbn: str) -> bool:
+    """Valida el dígito de control de un ISBN-10 (mód. 11) o ISBN-13 (mód. 10)."""
+    digits = isbn.translate(_STRIP_DASHSPACE).upper()
+    if len(digits) == 10:
+        if not digits[:9].isdigit() or not (digits[9].isdigit() or digits[9] == "X"):
+            return False
+        total = sum((10 - i) * int(d) for i, d in enumerate(digits[:9]))
+        total += 10 if digits[9] == "X" else int(digits[9])
+        return total % 11 == 0
+    if len(digits) == 13 and digits.isdigit():
+        total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+        return total % 10 == 0
+    return False
 
 
 def clean_text(s: str | None) -> str:
     if not s:
         return ""
-    s = re.sub(r"\s+", " ", s)
-    return s.strip()
+    # split() sin argumentos corta en los mismos espacios Unicode que \s+ y descarta los extremos
+    return " ".join(s.split())
 
 
 def normalize_price(raw: str) -> str:
     if not raw:
         return ""
-    raw = raw.replace("\xa0", " ")
     m = PRICE_PATTERN.search(raw)
     if not m:
         return clean_text(raw)
     symbol, amount = m.groups(default="")
     # Quitar miles tipo 10.900,00 / 10,900.00 / 10900
-    amount = amount.replace(" ", "").replace(".", "").replace(",", ".")
+    amount = amount.translate(_PRICE_TRANS)
     try:
         val = float(amount)
         # Muestra sin decimales si no aplica
-        return f"{symbol + ' ' if symbol else ''}{val:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+        return f"{symbol + ' ' if symbol else ''}{val:,.2f}".translate(_SWAP_SEPARATORS)
     except ValueError:
         return clean_text(raw)
 
@@ -89,19 +193,21 @@ class Selector:
     def __init__(self, mode: str, query: str):
         self.mode = mode  # 'css' o 'xpath'
         self.query = query.strip()
+        # XPath compilado una vez y reutilizado en todas las URLs del lote
+        self.xpath = etree.XPath(self.query) if (mode == "xpath" and self.query) else None
 
     def is_empty(self) -> bool:
         return self.query == ""
 
 
-def select_one_text(soup: BeautifulSoup, tree: lxml_html.HtmlElement, selector: Selector) -> str:
+def select_one_text(tree_sx: LexborHTMLParser, tree: lxml_html.HtmlElement | None, selector: Selector) -> str:
     if selector.is_empty():
         return ""
     if selector.mode == "css":
-        el = soup.select_one(selector.query)
-        return clean_text(el.get_text(" ") if el else "")
+        el = tree_sx.css_first(selector.query)
+        return clean_text(el.text(separator=" ") if el else "")
     else:
-        nodes = tree.xpath(selector.query)
+        nodes = selector.xpath(tree)
         if not nodes:
             return ""
         node = nodes[0]
@@ -110,14 +216,14 @@ def select_one_text(soup: BeautifulSoup, tree: lxml_html.HtmlElement, selector:
         return clean_text(str(node))
 
 
-def select_one_attr(soup: BeautifulSoup, tree: lxml_html.HtmlElement, selector: Selector, attr: str) -> str:
+def select_one_attr(tree_sx: LexborHTMLParser, tree: lxml_html.HtmlElement | None, selector: Selector, attr: str) -> str:
     if selector.is_empty():
         return ""
     if selector.mode == "css":
-        el = soup.select_one(selector.query)
-        return el.get(attr, "") if el else ""
+        el = tree_sx.css_first(selector.query)
+        return (el.attributes.get(attr) or "") if el else ""
     else:
-        nodes = tree.xpath(selector.query)
+        nodes = selector.xpath(tree)
         if not nodes:
             return ""
         node = nodes[0]
@@ -129,110 +235,135 @@ def select_one_attr(soup: BeautifulSoup, tree: lxml_html.HtmlElement, selector:
 
 # =============== Autodetección básica ===============
 
-def auto_title(soup: BeautifulSoup, tree: lxml_html.HtmlElement) -> str:
+# Selectores de respaldo, construidos una sola vez al importar el módulo
+# (lexbor compila cada consulta en C; no expone un selector precompilado reutilizable).
+_AUTO_IMAGE_SELS = (
+    'meta[property="og:image"]',
+    'meta[name="twitter:image"]',
+    'img.product, img.wp-post-image, img#product, img[class*="product"]',
+    'img',
+)
+_AUTO_DESCRIPTION_SELS = (
+    ".product-short-description",
+    ".woocommerce-product-details__short-description",
+    ".descripcion, .description, #description, #sinopsis, .sinopsis",
+    "article p",
+    "p",
+)
+_AUTO_PRICE_META_SELS = ('meta[itemprop="price"]', 'meta[property="product:price:amount"]')
+_AUTO_PRICE_SELS = (
+    ".price .amount",
+    "p.price",
+    ".woocommerce-Price-amount",
+    "[class*='price']",
+)
+_AUTO_SKU_SELS = (
+    "span.sku",
+    "#sku, .sku",
+)
+# Primer <li>/<tr> (en orden de documento) que mencione ISBN o SKU
+_AUTO_SKU_XPATH = etree.XPath(
+    "(//li[contains(., 'ISBN')] | //li[contains(., 'Sku')]"
+    " | //tr[contains(., 'ISBN')] | //tr[contains(., 'SKU')])[1]"
+)
+_AUTO_FICHA_SELS = (
+    "table.shop_attributes, table.woocommerce-product-attributes, table",
+    ".product-attributes, .woocommerce-product-attributes, .ficha, .ficha-tecnica, #ficha",
+    "dl, ul, ol",
+)
+
+def auto_title(tree_sx: LexborHTMLParser) -> str:
     # 1) h1 principal
-    h1 = soup.select_one("h1")
+    h1 = tree_sx.css_first("h1")
     if h1:
-        t = clean_text(h1.get_text(" "))
+        t = clean_text(h1.text(separator=" "))
         if len(t) > 0:
             return t
     # 2) og:title
-    meta = soup.select_one('meta[property="og:title"]')
-    if meta and meta.get("content"):
-        return clean_text(meta.get("content"))
+    meta = tree_sx.css_first('meta[property="og:title"]')
+    if meta and meta.attributes.get("content"):
+        return clean_text(meta.attributes.get("content"))
     # 3) title tag
-    if soup.title and soup.title.string:
-        return clean_text(soup.title.string)
+    title = tree_sx.css_first("title")
+    if title and title.text():
+        return clean_text(title.text())
     return ""
 
 
-def auto_image(soup: BeautifulSoup, base_url: str) -> str:
-    for q in [
-        'meta[property="og:image"]',
-        'meta[name="twitter:image"]',
-        'img.product, img.wp-post-image, img#product, img[class*="product"]',
-        'img',
-    ]:
-        el = soup.select_one(q)
+def auto_image(tree_sx: LexborHTMLParser, base_url: str) -> str:
+    for q in _AUTO_IMAGE_SELS:
+        el = tree_sx.css_first(q)
         if el:
-            src = el.get("content") or el.get("src") or ""
+            src = el.attributes.get("content") or el.attributes.get("src") or ""
             if src:
-                return urljoin(base_url, src)
+                return join_url(base_url, src)
     return ""
 
 
-def auto_description(soup: BeautifulSoup) -> str:
-    meta = soup.select_one('meta[name="description"]')
-    if meta and meta.get("content"):
-        return clean_text(meta.get("content"))
+def auto_description(tree_sx: LexborHTMLParser) -> str:
+    meta = tree_sx.css_first('meta[name="description"]')
+    if meta and meta.attributes.get("content"):
+        return clean_text(meta.attributes.get("content"))
     # Clases comunes
-    for q in [
-        ".product-short-description",
-        ".woocommerce-product-details__short-description",
-        ".descripcion, .description, #description, #sinopsis, .sinopsis",
-        "article p",
-        "p",
-    ]:
-        el = soup.select_one(q)
+    for q in _AUTO_DESCRIPTION_SELS:
+        el = tree_sx.css_first(q)
         if el:
-            return clean_text(el.get_text(" "))
+            return clean_text(el.text(separator=" "))
     return ""
 
 
-def auto_price(soup: BeautifulSoup) -> str:
+def auto_price_raw(tree_sx: LexborHTMLParser, body_text: Callable[[], str]) -> str:
+    # Devuelve el texto sin normalizar: extract_from_content normaliza una sola vez al final
     # Meta schemas
-    for q in ['meta[itemprop="price"]', 'meta[property="product:price:amount"]']:
-        el = soup.select_one(q)
-        if el and el.get("content"):
-            return normalize_price(el.get("content"))
+    for q in _AUTO_PRICE_META_SELS:
+        el = tree_sx.css_first(q)
+        if el and el.attributes.get("content"):
+            return el.attributes.get("content")
     # Selectores Woo/Shop comunes
-    for q in [
-        ".price .amount",
-        "p.price",
-        ".woocommerce-Price-amount",
-        "[class*='price']",
-    ]:
-        el = soup.select_one(q)
+    for q in _AUTO_PRICE_SELS:
+        el = tree_sx.css_first(q)
         if el:
-            return normalize_price(el.get_text(" "))
+            return el.text(separator=" ")
     # Cualquier número con símbolo
-    body_text = soup.get_text(" ")
-    m = PRICE_PATTERN.search(body_text)
-    return normalize_price(m.group(0)) if m else ""
-
-
-def auto_sku_isbn(soup: BeautifulSoup) -> str:
-    # Busca patrones "ISBN" o "SKU" en el texto
-    txt = soup.get_text(" ")
-    m = ISBN_PATTERN.search(txt)
-    if m:
-        return clean_text(m.group(1))
+    m = PRICE_PATTERN.search(body_text())
+    return m.group(0) if m else ""
+
+
+def auto_sku_isbn(tree_sx: LexborHTMLParser, tree: lxml_html.HtmlElement | None, content: bytes, body_text: Callable[[], str]) -> str:
+    # Busca patrones "ISBN" o "SKU" primero en el inicio del HTML crudo;
+    # los candidatos con checksum inválido se descartan y se prueba el siguiente
+    for m in ISBN_BYTES.finditer(content, 0, HEAD_SCAN_BYTES):
+        isbn = m.group(1).decode("ascii")
+        if isbn_checksum_ok(isbn):
+            return clean_text(isbn)
+    # ...y si no aparece, en el texto de toda la página
+    for m in ISBN_PATTERN.finditer(body_text()):
+        if isbn_checksum_ok(m.group(1)):
+            return clean_text(m.group(1))
     # Atributos comunes
-    for q in [
-        "span.sku",
-        "#sku, .sku",
-        "li:contains('ISBN'), li:contains('Sku'), tr:contains('ISBN'), tr:contains('SKU')",
-    ]:
+    for q in _AUTO_SKU_SELS:
+        el = tree_sx.css_first(q)
+        if el:
+            return clean_text(el.text(separator=" "))
+    # Filas/ítems que mencionan ISBN o SKU (el árbol lxml sólo se construye si hace falta)
+    if tree is None:
         try:
-            el = soup.select_one(q)
-            if el:
-                return clean_text(el.get_text(" "))
-        except Exception:
-            pass
+            tree = lxml_html.fromstring(content)
+        except etree.ParserError:
+            return ""
+    nodes = _AUTO_SKU_XPATH(tree)
+    if nodes:
+        return clean_text(nodes[0].text_content())
     return ""
 
 
-def auto_ficha_tecnica(soup: BeautifulSoup) -> str:
+def auto_ficha_tecnica(tree_sx: LexborHTMLParser) -> str:
     # Tablas o listas típicas con especificaciones
-    for q in [
-        "table.shop_attributes, table.woocommerce-product-attributes, table",
-        ".product-attributes, .woocommerce-product-attributes, .ficha, .ficha-tecnica, #ficha",
-        "dl, ul, ol",
-    ]:
-        el = soup.select_one(q)
+    for q in _AUTO_FICHA_SELS:
+        el = tree_sx.css_first(q)
         if el:
             # Texto compacto conservando pares clave:valor simples
-            text = clean_text(el.get_text(" | "))
+            text = clean_text(el.text(separator=" | "))
             return text
     return ""
 
@@ -240,15 +371,68 @@ def auto_ficha_tecnica(soup: BeautifulSoup) -> str:
 # =============== Lógica de extracción por URL ===============
 
 @st.cache_data(show_spinner=False)
-def fetch(url: str, timeout: int = 20) -> tuple[str, str]:
+def fetch(url: str, timeout: int = 20) -> tuple[bytes, str, str | None]:
     """
     Devuelve sólo datos serializables por pickle para evitar errores de caché:
-    - content (str)
+    - content (bytes sin decodificar, como máximo MAX_PAGE_BYTES)
     - base_url final (str)
+    - charset declarado en el Content-Type, o None (ver decode_html)
+    """
+    with get_session().get(url, stream=True, timeout=timeout) as resp:
+        resp.raise_for_status()
+        # Se corta por bytes acumulados: con chunked, iter_content entrega trozos de tamaño variable
+        chunks, size = [], 0
+        for chunk in resp.iter_content(FETCH_CHUNK_BYTES):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= MAX_PAGE_BYTES:
+                break
+        return b"".join(chunks)[:MAX_PAGE_BYTES], resp.url, header_charset(resp.headers.get("Content-Type", ""))
+
+
+async def fetch_all_async(urls: list[str], timeout: int = 20) -> list[tuple[bytes, str, str | None] | Exception]:
+    """
+    Variante asíncrona de `fetch` para lotes grandes: un solo event loop con un cliente
+    HTTP/2 que multiplexa las peticiones al mismo host.
+    Devuelve, en el mismo orden que `urls`, la tupla (content, base_url, charset) o la excepción.
     """
-    resp = SESSION.get(url, timeout=timeout)
-    resp.raise_for_status()
-    return resp.text, resp.url
+    limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_MAX_CONNECTIONS)
+    async with httpx.AsyncClient(
+        http2=True,
+        limits=limits,
+        timeout=timeout,
+        headers={"User-Agent": USER_AGENT},
+        follow_redirects=True,
+    ) as client:
+        async def get_one(url: str) -> tuple[bytes, str, str | None]:
+            async with client.stream("GET", url) as resp:
+                resp.raise_for_status()
+                chunks, size = [], 0
+                async for chunk in resp.aiter_bytes(FETCH_CHUNK_BYTES):
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= MAX_PAGE_BYTES:
+                        break
+                charset = header_charset(resp.headers.get("Content-Type", ""))
+                return b"".join(chunks)[:MAX_PAGE_BYTES], str(resp.url), charset
+
+        return await asyncio.gather(*(get_one(u) for u in urls), return_exceptions=True)
+
+
+RESULT_COLUMNS = ("url", "titulo", "sku_isbn", "ficha_tecnica", "sinopsis", "precio", "imagen", "error")
+
+
+def error_row(url: str, e: Exception) -> dict:
+    return {
+        "url": url,
+        "titulo": "",
+        "sku_isbn": "",
+        "ficha_tecnica": "",
+        "sinopsis": "",
+        "precio": "",
+        "imagen": "",
+        "error": f"HTTP/Parse: {e}"
+    }
 
 
 def extract_from_url(url: str,
@@ -261,50 +445,70 @@ def extract_from_url(url: str,
                      img_attr: str = "src",
                      autodetect: bool = True) -> dict:
     try:
-        content, base_url = fetch(url)
-soup = BeautifulSoup(content, "lxml")
-tree = lxml_html.fromstring(content)
+        content, base_url, charset = fetch(url)
     except Exception as e:
-        return {
-            "url": url,
-            "titulo": "",
-            "sku_isbn": "",
-            "ficha_tecnica": "",
-            "sinopsis": "",
-            "precio": "",
-            "imagen": "",
-            "error": f"HTTP/Parse: {e}"
-        }
+        return error_row(url, e)
+    return extract_from_content(url, content, base_url, sel_title, sel_sku, sel_ficha,
+                                sel_sinopsis, sel_precio, sel_imagen, img_attr, autodetect, charset)
+
+
+def extract_from_content(url: str,
+                         content: bytes,
+                         base_url: str,
+                         sel_title: Selector,
+                         sel_sku: Selector,
+                         sel_ficha: Selector,
+                         sel_sinopsis: Selector,
+                         sel_precio: Selector,
+                         sel_imagen: Selector,
+                         img_attr: str = "src",
+                         autodetect: bool = True,
+                         charset: str | None = None) -> dict:
+    # lxml sólo se usa para los selectores XPath (selectolax no soporta XPath)
+    need_xpath = any(
+        s.mode == "xpath" and not s.is_empty()
+        for s in (sel_title, sel_sku, sel_ficha, sel_sinopsis, sel_precio, sel_imagen)
+    )
+    try:
+        tree_sx = LexborHTMLParser(decode_html(content, charset))
+        tree = lxml_html.fromstring(content) if need_xpath else None
+    except Exception as e:
+        return error_row(url, e)
 
     # Selectores manuales
-    title = select_one_text(soup, tree, sel_title)
-    sku = select_one_text(soup, tree, sel_sku)
-    ficha = select_one_text(soup, tree, sel_ficha)
-    sinopsis = select_one_text(soup, tree, sel_sinopsis)
-    precio_raw = select_one_text(soup, tree, sel_precio)
-    imagen_rel = select_one_attr(soup, tree, sel_imagen, img_attr)
+    title = select_one_text(tree_sx, tree, sel_title)
+    sku = select_one_text(tree_sx, tree, sel_sku)
+    ficha = select_one_text(tree_sx, tree, sel_ficha)
+    sinopsis = select_one_text(tree_sx, tree, sel_sinopsis)
+    precio_raw = select_one_text(tree_sx, tree, sel_precio)
+    imagen_rel = select_one_attr(tree_sx, tree, sel_imagen, img_attr)
 
     if not imagen_rel and not sel_imagen.is_empty():
         # Si el selector manual apunta al elemento pero el src está en data-*, prueba data-src
-        imagen_rel = select_one_attr(soup, tree, sel_imagen, "data-src") or select_one_attr(soup, tree, sel_imagen, "data-original")
+        imagen_rel = select_one_attr(tree_sx, tree, sel_imagen, "data-src") or select_one_attr(tree_sx, tree, sel_imagen, "data-original")
 
     # Autodetección cuando falte algo
     if autodetect:
+        # Texto de la página: se calcula sólo si algún helper llega a su búsqueda en texto, y una sola vez
+        @functools.cache
+        def body_text() -> str:
+            return tree_sx.text(separator=" ")
+
         if not title:
-            title = auto_title(soup, tree)
+            title = auto_title(tree_sx)
         if not sku:
-            sku = auto_sku_isbn(soup)
+            sku = auto_sku_isbn(tree_sx, tree, content, body_text)
         if not ficha:
-            ficha = auto_ficha_tecnica(soup)
+            ficha = auto_ficha_tecnica(tree_sx)
         if not sinopsis:
-            sinopsis = auto_description(soup)
+            sinopsis = auto_description(tree_sx)
         if not precio_raw:
-            precio_raw = auto_price(soup)
+            precio_raw = auto_price_raw(tree_sx, body_text)
         if not imagen_rel:
-            imagen_rel = auto_image(soup, base_url)
+            imagen_rel = auto_image(tree_sx, base_url)
 
     precio = normalize_price(precio_raw)
-    imagen = urljoin(base_url, imagen_rel) if imagen_rel else ""
+    imagen = join_url(base_url, imagen_rel) if imagen_rel else ""
 
     return {
         "url": url,
@@ -318,6 +522,29 @@ tree = lxml_html.fromstring(content)
     }
 
 
+# =============== Exportación ===============
+
+def to_xlsx_bytes(df: pd.DataFrame, sheet_name: str = "scraper") -> bytes:
+    """
+    Escribe el Excel fila a fila con xlsxwriter en modo constant_memory (memoria constante
+    en número de filas). No usa `df.to_excel`: pandas escribe por columnas y en ese modo
+    xlsxwriter sólo conserva la fila en curso.
+    """
+    buffer = BytesIO()
+    workbook = xlsxwriter.Workbook(buffer, {
+        "constant_memory": True,
+        # El contenido raspado se guarda como texto tal cual
+        "strings_to_urls": False,
+        "strings_to_formulas": False,
+    })
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, df.columns)
+    for r, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(r, 0, row)
+    workbook.close()
+    return buffer.getvalue()
+
+
 # =============== UI Streamlit ===============
 
 st.set_page_config(page_title="Scraper Cómics & Manga", layout="wide")
@@ -353,6 +580,10 @@ with st.sidebar:
 
     st.divider()
     timeout = st.number_input("Timeout por URL (seg)", min_value=5, max_value=60, value=20)
+    async_mode = st.checkbox(
+        "Descarga asíncrona (httpx, HTTP/2)", value=False,
+        help="Recomendado para lotes de cientos o miles de URLs: un solo event loop en lugar de hilos.",
+    )
 
 # Entrada de URLs
 col_left, col_right = st.columns([2, 1])
@@ -393,44 +624,62 @@ if st.button("🚀 Extraer datos", type="primary"):
     else:
         st.info(f"Procesando {len(urls)} URL(s)…")
 
-        sel_title_obj = Selector(mode, title_sel)
-        sel_sku_obj = Selector(mode, sku_sel)
-        sel_ficha_obj = Selector(mode, ficha_sel)
-        sel_sin_obj = Selector(mode, sin_sel)
-        sel_precio_obj = Selector(mode, price_sel)
-        sel_img_obj = Selector(mode, img_sel)
+        try:
+            sel_title_obj = Selector(mode, title_sel)
+            sel_sku_obj = Selector(mode, sku_sel)
+            sel_ficha_obj = Selector(mode, ficha_sel)
+            sel_sin_obj = Selector(mode, sin_sel)
+            sel_precio_obj = Selector(mode, price_sel)
+            sel_img_obj = Selector(mode, img_sel)
+        except etree.XPathSyntaxError as e:
+            st.error(f"Selector XPath inválido: {e}")
+            st.stop()
+
+        extract_kwargs = dict(
+            sel_title=sel_title_obj,
+            sel_sku=sel_sku_obj,
+            sel_ficha=sel_ficha_obj,
+            sel_sinopsis=sel_sin_obj,
+            sel_precio=sel_precio_obj,
+            sel_imagen=sel_img_obj,
+            img_attr=img_attr,
+            autodetect=autodetect,
+        )
+
+        # Resultados por columna (no lista de dicts): el DataFrame se arma sin transponer ni inferir tipos
+        columns = {c: [""] * len(urls) for c in RESULT_COLUMNS}
+
+        def store(pos: int, row: dict) -> None:
+            for c in RESULT_COLUMNS:
+                columns[c][pos] = row[c]
 
-        rows = []
         progress = st.progress(0.0)
-        for i, url in enumerate(urls, start=1):
-            row = extract_from_url(
-                url=url,
-                sel_title=sel_title_obj,
-                sel_sku=sel_sku_obj,
-                sel_ficha=sel_ficha_obj,
-                sel_sinopsis=sel_sin_obj,
-                sel_precio=sel_precio_obj,
-                sel_imagen=sel_img_obj,
-                img_attr=img_attr,
-                autodetect=autodetect,
-            )
-            rows.append(row)
-            progress.progress(i / len(urls))
-
-        df = pd.DataFrame(rows, columns=[
-            "url", "titulo", "sku_isbn", "ficha_tecnica", "sinopsis", "precio", "imagen", "error"
-        ])
+        if async_mode:
+            pages = asyncio.run(fetch_all_async(urls, timeout=timeout))
+            for i, (url, page) in enumerate(zip(urls, pages), start=1):
+                if isinstance(page, Exception):
+                    store(i - 1, error_row(url, page))
+                else:
+                    content, base_url, charset = page
+                    store(i - 1, extract_from_content(url, content, base_url, charset=charset, **extract_kwargs))
+                progress.progress(i / len(urls))
+        else:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+                futures = {ex.submit(extract_from_url, url, **extract_kwargs): pos for pos, url in enumerate(urls)}
+                # Las filas conservan el orden de entrada aunque terminen desordenadas
+                for i, fut in enumerate(as_completed(futures), start=1):
+                    store(futures[fut], fut.result())
+                    progress.progress(i / len(urls))
+
+        df = pd.DataFrame(columns, dtype="string", copy=False)
 
         st.success("Extracción completa ✅")
-        st.dataframe(df, use_container_width=True, height=400)
+        st.dataframe(df, width="stretch", height=400)
 
         # Descarga Excel
-        buffer = BytesIO()
-        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="scraper")
         st.download_button(
             label="💾 Descargar Excel",
-            data=buffer.getvalue(),
+            data=to_xlsx_bytes(df),
             file_name="scraper_comics_manga.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         )
@@ -1,12 +1,19 @@
 # -*- coding: utf-8 -*-
 import io
 import re
-import hashlib
+import csv
+import math
+import functools
+from collections import deque
+from itertools import islice
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import streamlit as st
+import xxhash
+from openpyxl import load_workbook
 
 # ===================== Config =====================
 st.set_page_config(page_title="Armado de paquetes (lector de barras)", page_icon="📦", layout="wide")
@@ -14,32 +21,187 @@ st.title("📦 Armado de paquetes por factura (lector de barras)")
 st.caption("Escanea códigos y te indicamos si va a Perú, Chile o Colombia. Banner grande persistente, validaciones y progreso por ISBN.")
 
 # ===================== Utilidades =====================
+# Lecturas del escáner (ASCII): una tabla de borrado de no-alfanuméricos; el regex compilado cubre el resto
+_CODE_TRANS = str.maketrans("", "", "".join(chr(b) for b in range(128) if not chr(b).isalnum()))
+_NON_ALNUM = re.compile(r"[^0-9A-Za-z]")
+
 def norm_code(x) -> str:
     if x is None:
         return ""
-    return re.sub(r"[^0-9A-Za-z]", "", str(x)).upper()
+    s = str(x)
+    if s.isascii():
+        return s.translate(_CODE_TRANS).upper()
+    return _NON_ALNUM.sub("", s).upper()
 
-def guess_col(df: pd.DataFrame, names: List[str]) -> Optional[str]:
-    low = {c.lower(): c for c in df.columns}
+def guess_col(low: Dict[str, str], names: List[str]) -> Optional[str]:
+    """low: {encabezado.lower(): encabezado}, armado una vez por archivo."""
     for n in names:
         if n.lower() in low:
             return low[n.lower()]
     return None
 
+PREVIEW_ROWS = 50    # filas leídas para detectar encabezados antes de "Aplicar"
+
+def nombres_columnas(header: tuple, filas: List[tuple]) -> List[str]:
+    """Encabezados como los deja pandas: vacíos -> "Unnamed: i", repetidos -> "X.1", "X.2"..."""
+    ancho = max([len(header)] + [len(r) for r in filas])
+    header = list(header) + [None] * (ancho - len(header))
+    cols, vistos = [], {}
+    for i, h in enumerate(header):
+        name = f"Unnamed: {i}" if h is None else str(h)
+        base = name
+        while name in vistos:
+            vistos[base] += 1
+            name = f"{base}.{vistos[base]}"
+        vistos[name] = 0
+        cols.append(name)
+    return cols
+
+@st.cache_data(show_spinner=False)
+def leer_encabezados(sig: str, _contenido: bytes) -> List[str]:
+    """Encabezados de la primera hoja (mirando PREVIEW_ROWS filas), cacheados por firma del archivo.
+
+    El mapeo de columnas re-ejecuta el script con cada selectbox; la lectura completa queda para "Aplicar".
+    """
+    wb = load_workbook(io.BytesIO(_contenido), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()  # ver leer_factura
+        rows = list(islice(ws.iter_rows(values_only=True), PREVIEW_ROWS))
+    finally:
+        wb.close()
+    return nombres_columnas(rows[0] if rows else (), rows[1:])
+
+def leer_factura(contenido: bytes) -> Tuple[List[str], Dict[str, list]]:
+    """Lee la primera hoja en modo read-only y devuelve (encabezados, {columna: valores})."""
+    wb = load_workbook(io.BytesIO(contenido), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # En read-only openpyxl se detiene en el <dimension> guardado, que muchos exportadores dejan
+        # desactualizado (p. ej. "A1"); como pandas, se descarta y se lee hasta la última fila real
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, ())
+        filas = [r for r in rows]
+    finally:
+        wb.close()
+    # Filas vacías al final (max_row suele incluir celdas con solo formato)
+    while filas and all(v is None for v in filas[-1]):
+        filas.pop()
+
+    cols = nombres_columnas(header, filas)
+    data = {c: [r[i] if i < len(r) else None for r in filas] for i, c in enumerate(cols)}
+    return cols, data
+
+def celda_texto(v):
+    # Excel guarda números como float: 9780306406157.0 -> 9780306406157 (igual que pandas)
+    return int(v) if isinstance(v, float) and v.is_integer() else v
+
+_INT32 = np.iinfo(np.int32)
+
+def a_numero(v):
+    # Como pd.to_numeric(errors="coerce").fillna(0): números tal cual, texto numérico parseado, el resto 0
+    if isinstance(v, (int, float)):
+        x = v if v == v else 0
+    else:
+        try:
+            x = float(v)
+        except (TypeError, ValueError):
+            return 0
+        if not math.isfinite(x):
+            return 0
+    # Acotado a un paso fuera de int32: cabe en int64 y col_int32 lo detecta como fuera de rango
+    return min(max(x, _INT32.min - 1), _INT32.max + 1)
+
+def col_int32(values: Optional[list], n: int, col: str = "") -> np.ndarray:
+    """Cantidades como int32 (los float se truncan); ValueError si alguna no cabe en int32."""
+    if values is None:
+        return np.zeros(n, np.int32)
+    num = np.fromiter(map(a_numero, values), dtype=np.int64, count=n)
+    fuera = np.flatnonzero((num < _INT32.min) | (num > _INT32.max))
+    if len(fuera):
+        i = int(fuera[0])
+        raise ValueError(f"La columna '{col}' tiene {len(fuera)} cantidades fuera de rango "
+                         f"(p. ej. fila {i + 2}: {values[i]}).")
+    return num.astype(np.int32)
+
 def file_sig(uploaded_file) -> str:
-    return hashlib.md5(uploaded_file.getvalue()).hexdigest()
+    # Solo es una clave de identidad del archivo subido: xxh3 basta y es mucho más rápido que MD5
+    return format(xxhash.xxh3_64_intdigest(uploaded_file.getvalue()), "x")
+
+# Contadores por fila (arrays int32 en session_state, uno por columna): destino -> (escaneados, remanentes, variante)
+DESTINOS = {
+    "Perú":     ("sc_pe", "rem_pe", "pe"),
+    "Chile":    ("sc_cl", "rem_cl", "cl"),
+    "Colombia": ("sc_co", "rem_co", "co"),
+}
+CUPO_COLS = ["total", "peru", "chile", "colombia"]
+COUNTER_COLS = ["sc_pe", "sc_cl", "sc_co", "sc_total", "rem_pe", "rem_cl", "rem_co"]
+FACTURA_COLS = ["isbn", "nombre", *CUPO_COLS, "isbn_norm"]
+ESTADO_COLS = [*FACTURA_COLS, *COUNTER_COLS]
+_SHOW_ARRAY_COLS = [*CUPO_COLS, *COUNTER_COLS]
+_SHOW_COLS = ["isbn", "nombre", *_SHOW_ARRAY_COLS]     # tabla "Estado por título" y CSV
+# Columna de cada país en la matriz de remanentes ss.rem (N, 3)
+PAIS_COL = {"Perú": 0, "Chile": 1, "Colombia": 2}
+# scan_log / no_match: deques de tuplas con estas columnas, acotadas a LOG_MAX entradas
+LOG_COLS = ("ts", "code", "match", "destino", "idx")
+NO_MATCH_COLS = ("ts", "code")
+LOG_MAX = 100_000
+TAB_PREVIEW_ROWS = 200    # filas de "Estado por título" si no se pide la tabla completa
+
+def estado_df(df: pd.DataFrame, cols: List[str], arrays) -> pd.DataFrame:
+    """Vista factura + contadores (sin copias) con las columnas pedidas; se arma sólo al renderizar/exportar.
+
+    arrays: session_state o un dict con los arrays de cupos/contadores (fuera del hilo del script).
+    """
+    return pd.DataFrame({c: df[c] if c in df.columns else arrays[c] for c in cols}, copy=False)
+
+def mascaras_estado() -> Tuple[np.ndarray, np.ndarray]:
+    """(faltantes, sobrantes) como máscaras booleanas; se recalculan solo si cambió state_version."""
+    ss = st.session_state
+    if ss.get("mascaras_version") != ss.state_version:
+        ss.mask_faltantes = (ss.rem > 0).any(axis=1)
+        ss.mask_sobrantes = ss.sc_total > ss.total
+        ss.n_faltantes = int(np.count_nonzero(ss.mask_faltantes))
+        ss.n_sobrantes = int(np.count_nonzero(ss.mask_sobrantes))
+        ss.mascaras_version = ss.state_version
+    return ss.mask_faltantes, ss.mask_sobrantes
+
+def suma_filas(arr: np.ndarray, ix: np.ndarray):
+    # Caso común: el ISBN aparece en una sola fila -> lectura escalar, sin indexado ni reducción
+    return arr[ix[0]] if len(ix) == 1 else arr[ix].sum()
+
+def csv_estado(df: pd.DataFrame, arrays: Dict[str, np.ndarray]) -> bytes:
+    return estado_df(df, _SHOW_COLS, arrays).to_csv(index=False).encode("utf-8")
+
+def csv_registros(rows: deque, cols: Tuple[str, ...]) -> bytes:
+    """CSV de un registro de tuplas (log / no detectados) sin pasar por un DataFrame."""
+    out = io.StringIO()
+    w = csv.writer(out, lineterminator="\n")
+    w.writerow(cols)
+    w.writerows(list(rows))  # copia: el script puede seguir agregando mientras se descarga
+    return out.getvalue().encode("utf-8")
+
+def prio_cols(prioridad: List[str]) -> np.ndarray:
+    return np.array([PAIS_COL[p] for p in prioridad], dtype=np.int8)
 
 def ensure_session():
     ss = st.session_state
-    ss.setdefault("df", None)                 # DataFrame con tracking (mutado durante escaneo)
+    ss.setdefault("df", None)                 # DataFrame de la factura (isbn, nombre, isbn_norm); cupos y contadores van aparte
     ss.setdefault("base_cols", {})            # mapeo de columnas elegido
     ss.setdefault("file_sig", "")             # firma del archivo cargado
-    ss.setdefault("scan_log", [])             # [{ts, code, match, destino, idx}]
-    ss.setdefault("no_match", [])             # [{ts, code}]
+    ss.setdefault("scan_log", deque(maxlen=LOG_MAX))   # (ts, code, match, destino, idx)
+    ss.setdefault("no_match", deque(maxlen=LOG_MAX))   # (ts, code)
     ss.setdefault("prioridad", ["Perú", "Chile", "Colombia"])
-    ss.setdefault("incongruencias", pd.DataFrame())
-    ss.setdefault("duplicados", pd.DataFrame())
+    ss.setdefault("prio_cols", prio_cols(ss.prioridad))   # columnas de ss.rem en orden de prioridad
+    ss.setdefault("mask_incong", np.zeros(0, bool))   # filas con PE+CL+CO != Total
+    ss.setdefault("mask_dup", np.zeros(0, bool))      # filas con isbn_norm repetido
+    ss.setdefault("n_incong", 0)
+    ss.setdefault("n_dup", 0)
     ss.setdefault("last_banner_html", "")     # <-- banner persistente entre reruns
+    ss.setdefault("total_sum", 0)             # Σ total (fijo por factura)
+    ss.setdefault("scanned_sum", 0)           # Σ sc_total, se mantiene en cada escaneo/deshacer
+    ss.setdefault("state_version", 0)         # se incrementa con cada cambio de contadores
 
 ensure_session()
 
@@ -58,9 +220,16 @@ BANNER_CSS = """
 .banner.co { background:#fff9e1; border-color:#fbc02d; color:#8d6e00; }
 </style>
 """
+# El <style> se inyecta una vez por ejecución; los banners solo llevan el div
+st.markdown(BANNER_CSS, unsafe_allow_html=True)
+
+_BANNER_PREFIX = {v: f'<div class="banner {v}">' for v in ("success", "warn", "error", "pe", "cl", "co")}
+_BANNER_SUFFIX = "</div>"
+_FLAG = {"Perú": "🇵🇪 Perú", "Chile": "🇨🇱 Chile", "Colombia": "🇨🇴 Colombia"}
+
 def banner_html(text: str, variant: str = "success", subtitle: Optional[str] = None) -> str:
     sub = f'<span class="small">{subtitle}</span>' if subtitle else ""
-    return f'{BANNER_CSS}<div class="banner {variant}">{text}{sub}</div>'
+    return _BANNER_PREFIX[variant] + text + sub + _BANNER_SUFFIX
 
 # ===================== Carga de factura (no reinicia contadores) =====================
 c_left, c_right = st.columns([1, 1])
@@ -72,24 +241,26 @@ with c_left:
 with c_right:
     st.markdown("**Prioridad por país** (si un título aparece en más de un país, se asigna al primero con cupo):")
     prioridad = st.multiselect("Orden de asignación", ["Perú", "Chile", "Colombia"], default=st.session_state.prioridad)
-    if prioridad:
+    if prioridad and prioridad != st.session_state.prioridad:
         st.session_state.prioridad = prioridad
+        st.session_state.prio_cols = prio_cols(prioridad)
 
 if up:
-    data = pd.read_excel(up, engine="openpyxl", header=0)
+    contenido = up.getvalue()
     sig = file_sig(up)
+    cols = leer_encabezados(sig, contenido)
 
     st.subheader("Mapeo de columnas")
     st.caption("Si la autodetección falla, selecciona manualmente y pulsa **Aplicar/recargar archivo**.")
 
-    g_isbn   = guess_col(data, ["isbn", "código", "codigo", "ean", "barra", "id"])
-    g_nombre = guess_col(data, ["nombre", "titulo", "título", "descripcion", "descripción"])
-    g_total  = guess_col(data, ["total", "cantidad", "comprados", "qty"])
-    g_pe     = guess_col(data, ["peru", "perú"])
-    g_cl     = guess_col(data, ["chile"])
-    g_co     = guess_col(data, ["colombia"])
+    low = {c.lower(): c for c in cols}
+    g_isbn   = guess_col(low, ["isbn", "código", "codigo", "ean", "barra", "id"])
+    g_nombre = guess_col(low, ["nombre", "titulo", "título", "descripcion", "descripción"])
+    g_total  = guess_col(low, ["total", "cantidad", "comprados", "qty"])
+    g_pe     = guess_col(low, ["peru", "perú"])
+    g_cl     = guess_col(low, ["chile"])
+    g_co     = guess_col(low, ["colombia"])
 
-    cols = list(data.columns)
     def sbox(label: str, default: Optional[str], key: str) -> str:
         idx = cols.index(default) if (default in cols) else 0
         return st.selectbox(label, cols, index=min(idx, len(cols) - 1), key=key)
@@ -115,28 +286,46 @@ if up:
 
     need_reload = (sig != st.session_state.file_sig) or apply
     if need_reload:
+        _, data = leer_factura(contenido)
+        n = len(data[isbn_col])
+        # Cupos primero: si alguna cantidad no es válida no se toca el estado cargado
+        try:
+            cupos = [col_int32(data.get(c), n, c) for c in (total_col, pe_col, cl_col, co_col)]
+        except ValueError as e:
+            st.error(f"⚠️ {e} Revisa el mapeo de columnas y vuelve a aplicar.")
+            need_reload = False
+    if need_reload:
+        isbn = [celda_texto(v) for v in data[isbn_col]]
         df = pd.DataFrame({
-            "isbn":   data[isbn_col],
-            "nombre": data[nombre_col],
-            "total":  pd.to_numeric(data[total_col], errors="coerce").fillna(0).astype(int),
-            "peru":   pd.to_numeric(data[pe_col] if pe_col != none_opt else 0, errors="coerce").fillna(0).astype(int),
-            "chile":  pd.to_numeric(data[cl_col] if cl_col != none_opt else 0, errors="coerce").fillna(0).astype(int),
-            "colombia": pd.to_numeric(data[co_col] if co_col != none_opt else 0, errors="coerce").fillna(0).astype(int),
+            "isbn":   isbn,
+            "nombre": [celda_texto(v) for v in data[nombre_col]],
+            "isbn_norm": [norm_code(v) for v in isbn],
         })
-        df["isbn_norm"] = df["isbn"].map(norm_code)
-
-        dup = df[df["isbn_norm"].duplicated(keep=False)].copy()
-        suma_paises = df["peru"] + df["chile"] + df["colombia"]
-        incong = df.loc[suma_paises != df["total"]].copy()
-        st.session_state.duplicados = dup
-        st.session_state.incongruencias = incong
-
-        st.session_state.df = df.assign(
-            sc_pe=0, sc_cl=0, sc_co=0, sc_total=0,
-            rem_pe=lambda x: x["peru"],
-            rem_cl=lambda x: x["chile"],
-            rem_co=lambda x: x["colombia"],
-        )
+
+        # Cupos y estado de escaneo como arrays NumPy int32 (sin copias en el DataFrame):
+        # cada escaneo es un store indexado, no un setitem de pandas
+        ss = st.session_state
+        ss.total, ss.peru, ss.chile, ss.colombia = cupos
+        for c in ("sc_pe", "sc_cl", "sc_co", "sc_total"):
+            ss[c] = np.zeros(n, np.int32)
+        # Remanentes en una matriz (N, 3) [pe, cl, co]; rem_pe/rem_cl/rem_co son vistas de sus columnas
+        ss.rem = np.column_stack((ss.peru, ss.chile, ss.colombia))
+        ss.rem_pe, ss.rem_cl, ss.rem_co = ss.rem[:, 0], ss.rem[:, 1], ss.rem[:, 2]
+
+        # Validaciones del archivo como máscaras; las filas se recortan solo al abrir su pestaña.
+        # PE+CL+CO en int64 (tres cupos int32 válidos pueden desbordar int32), sumado en el mismo temporal.
+        suma = np.add(ss.peru, ss.chile, dtype=np.int64)
+        np.add(suma, ss.colombia, out=suma)
+        ss.mask_incong = np.not_equal(suma, ss.total)
+        ss.mask_dup = pd.Index(df["isbn_norm"]).duplicated(keep=False)
+        ss.n_incong = int(np.count_nonzero(ss.mask_incong))
+        ss.n_dup = int(np.count_nonzero(ss.mask_dup))
+        # isbn_norm -> posiciones (np.ndarray): búsqueda O(1) por escaneo en lugar de comparar toda la columna
+        ss.isbn_index = df.groupby("isbn_norm").indices
+        ss.total_sum = int(ss.total.sum())
+        ss.scanned_sum = 0
+        ss.state_version += 1
+        st.session_state.df = df
         st.session_state.base_cols = {
             "isbn": isbn_col, "nombre": nombre_col, "total": total_col,
             "peru": pe_col if pe_col != none_opt else None,
@@ -145,145 +334,147 @@ if up:
         }
         st.session_state.file_sig = sig
 
-        st.success(f"Factura aplicada. Filas: **{len(df)}** · Total esperado: **{int(df['total'].sum())}**")
-        if not dup.empty:
-            st.warning(f"⚠️ Hay **{len(dup)}** ISBN duplicados.")
-        if not incong.empty:
-            st.warning(f"⚠️ Hay **{len(incong)}** filas con incongruencia (PE+CL+CO ≠ Total).")
+        st.success(f"Factura aplicada. Filas: **{len(df)}** · Total esperado: **{ss.total_sum}**")
+        if ss.n_dup:
+            st.warning(f"⚠️ Hay **{ss.n_dup}** ISBN duplicados.")
+        if ss.n_incong:
+            st.warning(f"⚠️ Hay **{ss.n_incong}** filas con incongruencia (PE+CL+CO ≠ Total).")
 
 # ===================== Escaneo =====================
 if st.session_state.df is not None:
     df = st.session_state.df
+    ss = st.session_state
 
-    colA, colB, colC, colD = st.columns(4)
-    with colA: st.metric("Esperado (Total)", int(df["total"].sum()))
-    with colB: st.metric("Escaneado", int(df["sc_total"].sum()))
-    with colC: st.metric("Pendiente", int(df["total"].sum() - df["sc_total"].sum()))
-    with colD: st.metric("No detectados", len(st.session_state.no_match))
-
-    st.divider()
-    st.subheader("📸 Escanear código de barras")
-
-    # Banner persistente (repinta el último)
-    banner_slot = st.empty()
-    if st.session_state.last_banner_html:
-        banner_slot.markdown(st.session_state.last_banner_html, unsafe_allow_html=True)
-
-    auto_mode = st.checkbox("Auto-registrar al leer (no requiere ENTER)", value=True)
-
-    def show_banner(text: str, variant: str = "success", subtitle: Optional[str] = None):
-        html = banner_html(text, variant, subtitle)
-        st.session_state.last_banner_html = html
-        banner_slot.markdown(html, unsafe_allow_html=True)
-
-    def elegir_slot_para_codigo(indices: List[int]) -> Tuple[Optional[int], Optional[str]]:
-        for pais in st.session_state.prioridad:
-            for i in indices:
-                if pais == "Perú" and df.loc[i, "rem_pe"] > 0: return i, "Perú"
-                if pais == "Chile" and df.loc[i, "rem_cl"] > 0: return i, "Chile"
-                if pais == "Colombia" and df.loc[i, "rem_co"] > 0: return i, "Colombia"
-        return None, None
-
-    def registrar_codigo(raw_code: str):
-        code = norm_code(raw_code)
-        if not code:
-            return
-        ix_all = df.index[df["isbn_norm"] == code].tolist()
-        ts = datetime.now().isoformat(timespec="seconds")
-
-        if not ix_all:
-            st.session_state.no_match.append({"ts": ts, "code": code})
-            show_banner(f"NO DETECTADO: {code}", "error", "El código no está en la factura")
-            return
-
-        idx, destino = elegir_slot_para_codigo(ix_all)
-        if idx is None:
-            titulo = str(df.loc[ix_all[0], "nombre"])
-            total_isbn = int(df.loc[ix_all, "total"].sum())
-            total_esc  = int(df.loc[ix_all, "sc_total"].sum())
-            st.session_state.scan_log.append({"ts": ts, "code": code, "match": True, "destino": "COMPLETO", "idx": ix_all[0]})
-            show_banner(f"COMPLETO: {titulo}", "warn", f"Escaneado: {total_esc}/{total_isbn}")
-            return
-
-        # Actualizar contadores
-        titulo = str(df.loc[idx, "nombre"])
-        total_isbn = int(df.loc[ix_all, "total"].sum())
-        total_esc  = int(df.loc[ix_all, "sc_total"].sum())
-        if destino == "Perú":
-            df.loc[idx, "sc_pe"] += 1; df.loc[idx, "rem_pe"] -= 1; variant = "pe"
-        elif destino == "Chile":
-            df.loc[idx, "sc_cl"] += 1; df.loc[idx, "rem_cl"] -= 1; variant = "cl"
+    # Solo este panel se re-ejecuta con cada lectura del escáner (fragment);
+    # pestañas, descargas y mapeo se refrescan en el próximo rerun completo
+    @st.fragment
+    def panel_escaneo():
+        colA, colB, colC, colD = st.columns(4)
+        with colA: st.metric("Esperado (Total)", ss.total_sum)
+        with colB: st.metric("Escaneado", ss.scanned_sum)
+        with colC: st.metric("Pendiente", ss.total_sum - ss.scanned_sum)
+        with colD: st.metric("No detectados", len(st.session_state.no_match))
+
+        st.divider()
+        st.subheader("📸 Escanear código de barras")
+
+        # Banner persistente: se pinta al final del panel con el último aviso. El callback del
+        # lector no dibuja nada (en un rerun de fragment no está soportado), solo deja el HTML.
+        banner_slot = st.empty()
+
+        auto_mode = st.checkbox("Auto-registrar al leer (no requiere ENTER)", value=True)
+
+        def show_banner(text: str, variant: str = "success", subtitle: Optional[str] = None):
+            st.session_state.last_banner_html = banner_html(text, variant, subtitle)
+
+        def elegir_slot_para_codigo(indices: np.ndarray) -> Tuple[Optional[int], Optional[str]]:
+            # (P, K): primero por prioridad de país y luego por fila, el mismo orden que recorrer país -> filas
+            con_cupo = (ss.rem[np.ix_(indices, ss.prio_cols)] > 0).T.ravel()
+            first = int(np.argmax(con_cupo))
+            if not con_cupo[first]:
+                return None, None
+            p, row = divmod(first, len(indices))
+            return int(indices[row]), ss.prioridad[p]
+
+        def registrar_codigo(raw_code: str):
+            code = norm_code(raw_code)
+            if not code:
+                return
+            ix_all = ss.isbn_index.get(code)
+            ts = datetime.now().isoformat(timespec="seconds")
+
+            if ix_all is None:
+                st.session_state.no_match.append((ts, code))
+                show_banner(f"NO DETECTADO: {code}", "error", "El código no está en la factura")
+                return
+
+            idx, destino = elegir_slot_para_codigo(ix_all)
+            if idx is None:
+                titulo = str(df["nombre"].iat[ix_all[0]])
+                total_isbn = suma_filas(ss.total, ix_all)
+                total_esc  = suma_filas(ss.sc_total, ix_all)
+                st.session_state.scan_log.append((ts, code, True, "COMPLETO", int(ix_all[0])))
+                show_banner(f"COMPLETO: {titulo}", "warn", f"Escaneado: {total_esc}/{total_isbn}")
+                return
+
+            # Actualizar contadores
+            titulo = str(df["nombre"].iat[idx])
+            total_isbn = suma_filas(ss.total, ix_all)
+            total_esc  = suma_filas(ss.sc_total, ix_all)
+            sc_key, rem_key, variant = DESTINOS[destino]
+            ss[sc_key][idx] += 1; ss[rem_key][idx] -= 1
+            ss.sc_total[idx] += 1
+            ss.scanned_sum += 1
+            ss.state_version += 1
+
+            # Progreso tras sumar
+            total_esc += 1
+            pe_esc = suma_filas(ss.sc_pe, ix_all)
+            cl_esc = suma_filas(ss.sc_cl, ix_all)
+            co_esc = suma_filas(ss.sc_co, ix_all)
+            st.session_state.scan_log.append((ts, code, True, destino, idx))
+
+            show_banner(_FLAG[destino], variant, f"{titulo}<br>Escaneado: {total_esc}/{total_isbn} (PE {pe_esc} | CL {cl_esc} | CO {co_esc})")
+
+        # Input de lectura (auto o manual)
+        if auto_mode:
+            def _on_change():
+                v = st.session_state.get("scan_code", "")
+                registrar_codigo(v)
+                st.session_state.scan_code = ""  # limpiar para la próxima lectura
+            st.text_input("Apunta el lector aquí (auto)", key="scan_code", on_change=_on_change, placeholder="ISBN/EAN…")
+            st.caption("Deja el cursor aquí y dispara el lector; no necesitas ENTER.")
         else:
-            df.loc[idx, "sc_co"] += 1; df.loc[idx, "rem_co"] -= 1; variant = "co"
-        df.loc[idx, "sc_total"] += 1
-
-        # Progreso tras sumar
-        total_esc += 1
-        pe_esc = int(df.loc[ix_all, "sc_pe"].sum())
-        cl_esc = int(df.loc[ix_all, "sc_cl"].sum())
-        co_esc = int(df.loc[ix_all, "sc_co"].sum())
-        st.session_state.scan_log.append({"ts": ts, "code": code, "match": True, "destino": destino, "idx": idx})
-
-        destino_flag = destino.replace("Perú","🇵🇪 Perú").replace("Chile","🇨🇱 Chile").replace("Colombia","🇨🇴 Colombia")
-        show_banner(destino_flag, variant, f"{titulo}<br>Escaneado: {total_esc}/{total_isbn} (PE {pe_esc} | CL {cl_esc} | CO {co_esc})")
-
-    # Input de lectura (auto o manual)
-    if auto_mode:
-        def _on_change():
-            v = st.session_state.get("scan_code", "")
-            registrar_codigo(v)
-            st.session_state.scan_code = ""  # limpiar para la próxima lectura
-        st.text_input("Apunta el lector aquí (auto)", key="scan_code", on_change=_on_change, placeholder="ISBN/EAN…")
-        st.caption("Deja el cursor aquí y dispara el lector; no necesitas ENTER.")
-    else:
-        with st.form("scan_form", clear_on_submit=True):
-            code_in = st.text_input("Apunta el lector aquí y presiona Enter", placeholder="ISBN/EAN…")
-            submit = st.form_submit_button("Registrar")
-        if submit and code_in:
-            registrar_codigo(code_in)
-
-    # Controles
-    c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
-    with c1:
-        if st.button("↩️ Deshacer último escaneo"):
-            if st.session_state.scan_log:
-                last = st.session_state.scan_log.pop()
-                if last["match"] and last["destino"] in {"Perú","Chile","Colombia"}:
-                    i = last["idx"]
-                    df.loc[i, "sc_total"] -= 1
-                    if last["destino"] == "Perú":
-                        df.loc[i, "sc_pe"] -= 1; df.loc[i, "rem_pe"] += 1
-                    elif last["destino"] == "Chile":
-                        df.loc[i, "sc_cl"] -= 1; df.loc[i, "rem_cl"] += 1
-                    elif last["destino"] == "Colombia":
-                        df.loc[i, "sc_co"] -= 1; df.loc[i, "rem_co"] += 1
-                show_banner("Deshecho el último escaneo", "warn")
-            else:
-                st.warning("No hay escaneos para deshacer.")
-    with c2:
-        if st.button("🧹 Reiniciar escaneos"):
-            df[["sc_pe","sc_cl","sc_co","sc_total"]] = 0
-            df[["rem_pe","rem_cl","rem_co"]] = df[["peru","chile","colombia"]]
-            st.session_state.scan_log.clear()
-            st.session_state.no_match.clear()
-            show_banner("Reiniciado", "warn", "Se reiniciaron contadores y registros")
-    with c3:
-        faltantes = df[(df["rem_pe"]>0) | (df["rem_cl"]>0) | (df["rem_co"]>0)]
-        sobrantes = df[df["sc_total"] > df["total"]]
-        alertas = []
-        if not faltantes.empty: alertas.append(f"Faltan títulos/cantidades: **{len(faltantes)}**.")
-        if not sobrantes.empty: alertas.append(f"Sobre-escaneos: **{len(sobrantes)}**.")
-        if st.session_state.no_match: alertas.append(f"No detectados: **{len(st.session_state.no_match)}**.")
-        if st.session_state.duplicados is not None and not st.session_state.duplicados.empty:
-            alertas.append(f"Duplicados (archivo): **{len(st.session_state.duplicados)}**.")
-        if st.session_state.incongruencias is not None and not st.session_state.incongruencias.empty:
-            alertas.append(f"Incongruencias Total≠suma países: **{len(st.session_state.incongruencias)}**.")
-        if alertas: st.warning(" | ".join(alertas))
-        else: st.success("🎉 Todo validado: cantidades congruentes y sin no-detectados.")
-    with c4:
-        if st.button("🧼 Ocultar aviso"):
-            st.session_state.last_banner_html = ""
-            banner_slot.empty()
+            with st.form("scan_form", clear_on_submit=True):
+                code_in = st.text_input("Apunta el lector aquí y presiona Enter", placeholder="ISBN/EAN…")
+                submit = st.form_submit_button("Registrar")
+            if submit and code_in:
+                registrar_codigo(code_in)
+
+        # Controles
+        c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
+        with c1:
+            if st.button("↩️ Deshacer último escaneo"):
+                if st.session_state.scan_log:
+                    _, _, match, destino, i = st.session_state.scan_log.pop()
+                    if match and destino in DESTINOS:
+                        sc_key, rem_key, _ = DESTINOS[destino]
+                        ss.sc_total[i] -= 1
+                        ss[sc_key][i] -= 1; ss[rem_key][i] += 1
+                        ss.scanned_sum -= 1
+                        ss.state_version += 1
+                    show_banner("Deshecho el último escaneo", "warn")
+                else:
+                    st.warning("No hay escaneos para deshacer.")
+        with c2:
+            if st.button("🧹 Reiniciar escaneos"):
+                for c in ("sc_pe", "sc_cl", "sc_co", "sc_total"):
+                    ss[c][:] = 0
+                ss.rem_pe[:] = ss.peru; ss.rem_cl[:] = ss.chile; ss.rem_co[:] = ss.colombia
+                ss.scanned_sum = 0
+                ss.state_version += 1
+                st.session_state.scan_log.clear()
+                st.session_state.no_match.clear()
+                show_banner("Reiniciado", "warn", "Se reiniciaron contadores y registros")
+        with c3:
+            mascaras_estado()
+            n_faltantes, n_sobrantes = ss.n_faltantes, ss.n_sobrantes
+            alertas = []
+            if n_faltantes: alertas.append(f"Faltan títulos/cantidades: **{n_faltantes}**.")
+            if n_sobrantes: alertas.append(f"Sobre-escaneos: **{n_sobrantes}**.")
+            if st.session_state.no_match: alertas.append(f"No detectados: **{len(st.session_state.no_match)}**.")
+            if ss.n_dup: alertas.append(f"Duplicados (archivo): **{ss.n_dup}**.")
+            if ss.n_incong: alertas.append(f"Incongruencias Total≠suma países: **{ss.n_incong}**.")
+            if alertas: st.warning(" | ".join(alertas))
+            else: st.success("🎉 Todo validado: cantidades congruentes y sin no-detectados.")
+        with c4:
+            if st.button("🧼 Ocultar aviso"):
+                st.session_state.last_banner_html = ""
+
+        if st.session_state.last_banner_html:
+            banner_slot.markdown(st.session_state.last_banner_html, unsafe_allow_html=True)
+
+    panel_escaneo()
 
     st.divider()
 
@@ -297,52 +488,59 @@ if st.session_state.df is not None:
         "🧮 Incongruencias (archivo)"
     ])
 
+    # Las pestañas se renderizan aunque estén ocultas: cada tabla va tras su casilla para no
+    # serializarla al navegador en cada lectura del escáner
+
     with tab1:
-        show = df[["isbn","nombre","total","peru","chile","colombia",
-                   "sc_pe","sc_cl","sc_co","sc_total","rem_pe","rem_cl","rem_co"]]
-        st.dataframe(show, use_container_width=True, height=420)
+        if st.checkbox("Mostrar tabla", key="ver_tab1"):
+            todo = st.checkbox(f"Mostrar todas las filas (por defecto las primeras {TAB_PREVIEW_ROWS})", key="ver_tab1_todo")
+            show = estado_df(df, _SHOW_COLS, ss)
+            st.dataframe(show if todo else show.head(TAB_PREVIEW_ROWS), width="stretch", height=420)
 
     with tab2:
         if st.session_state.no_match:
-            st.dataframe(pd.DataFrame(st.session_state.no_match), use_container_width=True, height=300)
+            if st.checkbox("Mostrar tabla", key="ver_tab2"):
+                st.dataframe(pd.DataFrame(list(st.session_state.no_match), columns=NO_MATCH_COLS), width="stretch", height=300)
         else:
             st.success("Sin no-detectados por ahora.")
 
     with tab3:
         if st.session_state.scan_log:
-            st.dataframe(pd.DataFrame(st.session_state.scan_log), use_container_width=True, height=300)
+            if st.checkbox("Mostrar tabla", key="ver_tab3"):
+                st.dataframe(pd.DataFrame(list(st.session_state.scan_log), columns=LOG_COLS), width="stretch", height=300)
         else:
             st.info("Aún no hay escaneos registrados.")
 
     with tab4:
-        faltantes = df[(df["rem_pe"] > 0) | (df["rem_cl"] > 0) | (df["rem_co"] > 0)]
-        sobrantes = df[df["sc_total"] > df["total"]]
-        st.write("**Faltantes** (remanentes > 0):")
-        st.dataframe(faltantes, use_container_width=True, height=220)
-        st.write("**Sobre-escaneos** (sc_total > total):")
-        st.dataframe(sobrantes, use_container_width=True, height=220)
+        if st.checkbox("Mostrar tablas", key="ver_tab4"):
+            mask_falt, mask_sobr = mascaras_estado()
+            estado = estado_df(df, ESTADO_COLS, ss)
+            st.write("**Faltantes** (remanentes > 0):")
+            st.dataframe(estado[mask_falt], width="stretch", height=220)
+            st.write("**Sobre-escaneos** (sc_total > total):")
+            st.dataframe(estado[mask_sobr], width="stretch", height=220)
 
     with tab5:
-        if st.session_state.duplicados is not None and not st.session_state.duplicados.empty:
-            st.dataframe(st.session_state.duplicados, use_container_width=True, height=300)
+        if ss.n_dup:
+            if st.checkbox("Mostrar tabla", key="ver_tab5"):
+                st.dataframe(estado_df(df, FACTURA_COLS, ss)[ss.mask_dup], width="stretch", height=300)
         else:
             st.success("Sin duplicados en el archivo.")
 
     with tab6:
-        if st.session_state.incongruencias is not None and not st.session_state.incongruencias.empty:
-            st.dataframe(st.session_state.incongruencias, use_container_width=True, height=300)
+        if ss.n_incong:
+            if st.checkbox("Mostrar tabla", key="ver_tab6"):
+                st.dataframe(estado_df(df, FACTURA_COLS, ss)[ss.mask_incong], width="stretch", height=300)
         else:
             st.success("Sin incongruencias Total vs países.")
 
     # Descargas
     st.divider()
     d1, d2, d3 = st.columns(3)
-    out_state = io.StringIO(); show.to_csv(out_state, index=False)
-    d1.download_button("⬇️ Descargar estado (CSV)", out_state.getvalue().encode("utf-8"),
+    # Los CSV se generan al pulsar el botón (callable), no en cada rerun
+    d1.download_button("⬇️ Descargar estado (CSV)", functools.partial(csv_estado, df, {c: ss[c] for c in _SHOW_ARRAY_COLS}),
                        "estado_actual.csv", "text/csv")
-    out_log = io.StringIO(); pd.DataFrame(st.session_state.scan_log).to_csv(out_log, index=False)
-    d2.download_button("⬇️ Descargar log (CSV)", out_log.getvalue().encode("utf-8"),
+    d2.download_button("⬇️ Descargar log (CSV)", functools.partial(csv_registros, st.session_state.scan_log, LOG_COLS),
                        "log_escaneos.csv", "text/csv")
-    out_nf = io.StringIO(); pd.DataFrame(st.session_state.no_match).to_csv(out_nf, index=False)
-    d3.download_button("⬇️ Descargar no detectados (CSV)", out_nf.getvalue().encode("utf-8"),
+    d3.download_button("⬇️ Descargar no detectados (CSV)", functools.partial(csv_registros, st.session_state.no_match, NO_MATCH_COLS),
                        "no_detectados.csv", "text/csv")
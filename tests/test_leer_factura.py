@@ -0,0 +1,47 @@
+import io
+import re
+import sys
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import Workbook
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import streamlit_app as app  # noqa: E402
+
+
+def xlsx_con_dimension_vieja() -> bytes:
+    """Factura de 10 filas x 3 columnas cuyo <dimension> dice "A1" (como dejan algunos exportadores)."""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["isbn", "nombre", "total"])
+    for i in range(10):
+        ws.append([f"97803064061{i:02d}", f"Libro {i}", i + 1])
+    buf = io.BytesIO()
+    wb.save(buf)
+
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(buf.getvalue())) as zin, zipfile.ZipFile(out, "w") as zout:
+        for item in zin.infolist():
+            data = zin.read(item.filename)
+            if item.filename == "xl/worksheets/sheet1.xml":
+                data = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="A1"', data)
+            zout.writestr(item, data)
+    return out.getvalue()
+
+
+def test_leer_factura_ignora_dimension_vieja():
+    contenido = xlsx_con_dimension_vieja()
+    esperado = pd.read_excel(io.BytesIO(contenido), engine="openpyxl")
+
+    cols, data = app.leer_factura(contenido)
+
+    assert cols == list(esperado.columns) == ["isbn", "nombre", "total"]
+    assert len(data["isbn"]) == len(esperado) == 10
+    assert data["total"] == list(range(1, 11))
+
+
+def test_leer_encabezados_ignora_dimension_vieja():
+    contenido = xlsx_con_dimension_vieja()
+    assert app.leer_encabezados("dimension-vieja", contenido) == ["isbn", "nombre", "total"]